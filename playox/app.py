@@ -1,14 +1,83 @@
-from fastapi import FastAPI, HTTPException
+import asyncio
+import uuid
+from collections import OrderedDict
+from collections.abc import Callable
+from operator import attrgetter
+from typing import overload
+
+import orjson
+from fastapi import FastAPI, HTTPException, Response
+from fastapi.responses import ORJSONResponse
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel, Field, computed_field
+from pydantic import BaseModel, Field
 
 from playox.game import Game, GameError, GameOver, Move, random_move
 
-api = FastAPI(title="PlayOX API")
+api = FastAPI(title="PlayOX API", default_response_class=ORJSONResponse)
 
 
-# Store games by id in memory in the running process.
-GAMES: dict[str, Game] = {}
+# The most games to keep in memory before dropping the least recently used
+MAX_GAMES = 10_000
+
+
+class LRUDict[K, V](OrderedDict[K, V]):
+    """A dictionary that holds at most maxsize items, dropping the least recently
+    used item when a new one is added
+
+    on_evict, if given, is called with the key and value of each dropped item.
+    """
+
+    def __init__(self, maxsize: int, on_evict: Callable[[K, V], None] | None = None):
+        super().__init__()
+        self.maxsize = maxsize
+        self.on_evict = on_evict
+
+    def __getitem__(self, key: K) -> V:
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+
+    @overload
+    def get(self, key: object, default: None = None, /) -> V | None: ...
+    @overload
+    def get(self, key: object, default: V, /) -> V: ...
+    @overload
+    def get[D](self, key: object, default: D, /) -> V | D: ...
+    def get(self, key, default=None, /):
+        if key in self:
+            return self[key]
+        return default
+
+    def __setitem__(self, key: K, value: V) -> None:
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        if len(self) > self.maxsize:
+            evicted_key, evicted_value = self.popitem(last=False)
+            if self.on_evict is not None:
+                self.on_evict(evicted_key, evicted_value)
+
+
+# Serialized response bodies by game id, along with the game version they were
+# serialized from. Games only change when a move is played, so the same bytes
+# are returned until the game's version changes.
+GAME_RESPONSES: dict[uuid.UUID, tuple[int, bytes]] = {}
+MOVES_RESPONSES: dict[uuid.UUID, tuple[int, bytes]] = {}
+
+# Locks held while a move is being made in a game, by game id
+LOCKS: dict[uuid.UUID, asyncio.Lock] = {}
+
+
+# Drop everything held for a game once the game itself has been dropped, so
+# the caches and locks are bounded by the games that are still stored
+def forget_game(game_id: uuid.UUID, _game: Game) -> None:
+    GAME_RESPONSES.pop(game_id, None)
+    MOVES_RESPONSES.pop(game_id, None)
+    LOCKS.pop(game_id, None)
+
+
+# Store games by id in memory in the running process. Games that have been
+# dropped are no longer found, and get the same 404 as any other unknown id.
+GAMES: LRUDict[uuid.UUID, Game] = LRUDict(MAX_GAMES, on_evict=forget_game)
 
 
 # Move model for requests, which just takes X, Y coordinates
@@ -17,56 +86,99 @@ class RequestMove(BaseModel):
     y: int = Field(..., ge=0, le=2, description="Y coordinate (0-2)")
 
 
-# Response class for Game that hides the positions list and adds a computed
-# 3x3 game board representation
-class ResponseGame(Game):
-    positions: list[str] | None = Field(default=None, exclude=True)
+# Build the API representation of a game, which hides the internal positions
+# and adds a 3x3 game board representation
+def serialize_game(game: Game) -> dict:
+    data = game.model_dump(exclude={"positions", "x_mask", "o_mask", "created_seq"})
+    # positions is built from the game's bitmasks, so only build it once
+    positions = game.positions
+    data["board"] = [positions[0:3], positions[3:6], positions[6:9]]
+    return data
+
+
+# Build the API representation of a game's moves
+def serialize_moves(game: Game) -> list[dict]:
+    return [move.model_dump() for move in game.moves]
 
-    @computed_field(return_type=list[list[str]])
-    def board(self) -> list[list[str]]:
-        return [self.positions[i : i + 3] for i in range(0, 9, 3)]
 
+# Get a JSON response body for the game from the given cache, serializing the
+# game again if it has changed since the body was cached
+def cached_json(
+    cache: dict[uuid.UUID, tuple[int, bytes]],
+    game: Game,
+    serialize: Callable[[Game], object],
+) -> bytes:
+    cached = cache.get(game.id)
+    if cached is None or cached[0] != game.version:
+        cached = cache[game.id] = (game.version, orjson.dumps(serialize(game)))
+    return cached[1]
+
+
+def json_response(body: bytes) -> Response:
+    return Response(body, media_type="application/json")
+
+
+# Get a game by the id given in a request, raising a 404 if the id isn't a
+# valid UUID or there is no game with that id
+def find_game(game_id: str) -> Game:
+    try:
+        game = GAMES.get(uuid.UUID(game_id))
+    except ValueError:
+        game = None
 
-@api.get("/games", response_model=list[ResponseGame])
-def list_games():
+    if not game:
+        raise HTTPException(404, "Game not found")
+
+    return game
+
+
+# Get the lock for a game, creating it the first time it's needed
+def game_lock(game: Game) -> asyncio.Lock:
+    lock = LOCKS.get(game.id)
+    if lock is None:
+        lock = LOCKS[game.id] = asyncio.Lock()
+    return lock
+
+
+@api.get("/games")
+async def list_games() -> Response:
     """List all available games in the order they were created"""
-    # I'm relying on Python 3.7+'s preservation of insert order for dictionaries
-    # to return these in chronological order
-    return list(GAMES.values())
+    # Games are sorted by their creation sequence number rather than relying on
+    # the order they were stored in. Each game's cached body is reused, so only
+    # games that have changed are serialized again.
+    games = b",".join(
+        cached_json(GAME_RESPONSES, game, serialize_game)
+        for game in sorted(GAMES.values(), key=attrgetter("created_seq"))
+    )
+    return json_response(b"[" + games + b"]")
 
 
 @api.post("/games")
-def post_game() -> str:
+async def post_game() -> str:
     """Create a new game, returning the game id"""
     game = Game()
-    GAMES[str(game.id)] = game
+    GAMES[game.id] = game
     return str(game.id)
 
 
-@api.get("/games/{game_id}", response_model=ResponseGame)
-def get_game(game_id: str) -> Game:
+@api.get("/games/{game_id}")
+async def get_game(game_id: str) -> Response:
     """Get game state by id"""
-    game = GAMES.get(game_id)
+    game = find_game(game_id)
 
-    if not game:
-        raise HTTPException(404, "Game not found")
+    return json_response(cached_json(GAME_RESPONSES, game, serialize_game))
 
-    return game
 
-
-@api.get("/games/{game_id}/moves", response_model=list[Move])
-def list_moves(game_id: str):
+@api.get("/games/{game_id}/moves")
+async def list_moves(game_id: str) -> Response:
     """List all moves in a game chronologically."""
-    game = GAMES.get(game_id)
+    game = find_game(game_id)
 
-    if not game:
-        raise HTTPException(404, "Game not found")
+    return json_response(cached_json(MOVES_RESPONSES, game, serialize_moves))
 
-    return game.moves
 
-
-@api.post("/games/{game_id}/moves", response_model=ResponseGame)
-def post_move(game_id: str, move: RequestMove):
+@api.post("/games/{game_id}/moves")
+async def post_move(game_id: str, move: RequestMove) -> Response:
     """Add a move to a game by id
 
     This will trigger a responding random move from the computer player.
@@ -75,35 +187,39 @@ def post_move(game_id: str, move: RequestMove):
     that are raised making the move (such as if the game is finished, or it's
     not the player's turn).
     """
-    game = GAMES.get(game_id)
-
-    if not game:
-        raise HTTPException(404, "Game not found")
+    game = find_game(game_id)
 
-    if game.finished:
-        raise HTTPException(400, "Game already finished")
+    # Checking the game state and playing both moves happens under the game's
+    # lock. Nothing in this block awaits, so as written another request can't
+    # run in between anyway; the lock is here so that stays true if anything
+    # that awaits (such as persisting the game) is added. Reads don't take the
+    # lock, and requests for other games aren't held up by it.
+    async with game_lock(game):
+        if game.finished:
+            raise HTTPException(400, "Game already finished")
 
-    game_move = Move(x=move.x, y=move.y, player=game.next_player)
+        # The coordinates have already been validated as a RequestMove
+        game_move = Move.model_construct(x=move.x, y=move.y, player=game.next_player)
 
-    try:
-        game.play(game_move)
-    except GameError as err:
-        raise HTTPException(400, str(err)) from err
+        try:
+            game.play(game_move)
+        except GameError as err:
+            raise HTTPException(400, str(err)) from err
 
-    # Check for winner or draw
-    if game.winner or game.finished:
-        return game
+        # Check for winner or draw
+        if game.winner or game.finished:
+            return json_response(cached_json(GAME_RESPONSES, game, serialize_game))
 
-    # Play a random move for the alternative player, unless the game is over
-    try:
-        rand_move = random_move(game, game.next_player)
-        game.play(rand_move)
-    except GameOver:
-        pass
+        # Play a random move for the alternative player, unless the game is over
+        try:
+            rand_move = random_move(game, game.next_player)
+            game.play(rand_move)
+        except GameOver:
+            pass
 
-    return game
+        return json_response(cached_json(GAME_RESPONSES, game, serialize_game))
 
 
-app = FastAPI(title="PlayOX")
+app = FastAPI(title="PlayOX", default_response_class=ORJSONResponse)
 app.mount("/api", api)
 app.mount("/", StaticFiles(directory="html", html=True), name="html")
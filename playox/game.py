@@ -1,8 +1,18 @@
+import itertools
 import random
+import time
 import uuid
+from collections import deque
 from datetime import datetime
 
-from pydantic import BaseModel, Field, computed_field, field_validator
+from pydantic import (
+    BaseModel,
+    ConfigDict,
+    Field,
+    PrivateAttr,
+    computed_field,
+    model_validator,
+)
 
 # Tic tac toe has specific winning positions, so if any one player occupies
 # all positions within any of these possibilities, they are the winner.
@@ -22,6 +32,85 @@ WINNING_POSITIONS = [
     (2, 4, 6),
 ]
 
+# Player positions are stored as bitmasks, with bit n set when the player
+# occupies position n on the board. The winning positions above are converted
+# into the same form so that a win can be checked with a single bitwise AND.
+WINNING_MASKS = [sum(1 << position for position in line) for line in WINNING_POSITIONS]
+
+# Bitmask with every position on the board occupied
+FULL_BOARD = 0b111111111
+
+# The positions set in every possible bitmask of the board, indexed by mask, so
+# that the empty positions of a board can be looked up rather than scanned for.
+SET_BITS = [
+    tuple(position for position in range(9) if mask >> position & 1)
+    for mask in range(FULL_BOARD + 1)
+]
+
+# Check whether a player's bitmask contains any winning mask. This is generated
+# from WINNING_MASKS as a single unrolled boolean expression, so that checking
+# for a win doesn't loop over the masks in Python.
+check_win = eval(
+    "lambda mask: " + " or ".join(f"(mask & {m}) == {m}" for m in WINNING_MASKS)
+)
+
+
+def build_transitions() -> dict[tuple[int, int, int, str], tuple]:
+    """Map every legal move from every reachable board to the resulting board
+
+    Keys are (x_mask, o_mask, position, player), and values are the new
+    (x_mask, o_mask, winner, finished) after that player plays the position.
+    There are only a few thousand reachable boards, so these are found with a
+    breadth-first search from the empty board.
+    """
+    transitions = {}
+    queue = deque([(0, 0)])
+    seen = {(0, 0)}
+
+    while queue:
+        x_mask, o_mask = queue.popleft()
+        player = "X" if x_mask.bit_count() == o_mask.bit_count() else "O"
+        occupied = x_mask | o_mask
+
+        for position in range(9):
+            if occupied >> position & 1:
+                continue
+
+            if player == "X":
+                new_x_mask, new_o_mask = x_mask | 1 << position, o_mask
+            else:
+                new_x_mask, new_o_mask = x_mask, o_mask | 1 << position
+
+            if check_win(new_x_mask):
+                winner = "X"
+            elif check_win(new_o_mask):
+                winner = "O"
+            else:
+                winner = None
+            finished = winner is not None or new_x_mask | new_o_mask == FULL_BOARD
+
+            transitions[x_mask, o_mask, position, player] = (
+                new_x_mask,
+                new_o_mask,
+                winner,
+                finished,
+            )
+
+            # Keep searching from the new board unless the game is over
+            if not finished and (new_x_mask, new_o_mask) not in seen:
+                seen.add((new_x_mask, new_o_mask))
+                queue.append((new_x_mask, new_o_mask))
+
+    return transitions
+
+
+TRANSITIONS = build_transitions()
+
+
+# Games are numbered in the order they're created, so they can be ordered
+# without relying on how they're stored
+GAME_SEQUENCE = itertools.count()
+
 
 class GameError(ValueError):
     """To be raised for errors during a game"""
@@ -38,19 +127,54 @@ class GameOver(GameError):
 class Move(BaseModel):
     """The x,y coordinates and player of a move on the game board"""
 
+    model_config = ConfigDict(extra="ignore")
+
     x: int
     y: int
     player: str
-    # Not timezone aware
-    timestamp: datetime = Field(default_factory=datetime.now)
+    # Nanoseconds since the epoch, which is cheaper to get than a datetime and
+    # is only converted when the move is serialized. It's truncated to the
+    # microseconds a datetime can hold, so it survives being serialized.
+    timestamp_ns: int = Field(
+        default_factory=lambda: time.time_ns() // 1000 * 1000, exclude=True
+    )
+
+    @computed_field(return_type=datetime)
+    @property
+    def timestamp(self) -> datetime:
+        """When the move was made, not timezone aware"""
+        return datetime.fromtimestamp(self.timestamp_ns // 1_000_000_000).replace(
+            microsecond=self.timestamp_ns // 1000 % 1_000_000
+        )
+
+    @model_validator(mode="before")
+    @classmethod
+    def timestamp_to_ns(cls, data):
+        """Convert a given timestamp, such as one from a serialized move, to
+        nanoseconds so that it isn't replaced with the current time"""
+        if not isinstance(data, dict) or "timestamp" not in data:
+            return data
+
+        data = dict(data)
+        timestamp = data.pop("timestamp")
+        if "timestamp_ns" not in data:
+            if isinstance(timestamp, str):
+                timestamp = datetime.fromisoformat(timestamp)
+            seconds = int(timestamp.replace(microsecond=0).timestamp())
+            data["timestamp_ns"] = (
+                seconds * 1_000_000_000 + timestamp.microsecond * 1000
+            )
+        return data
 
     def get_position(self) -> int:
         return self.y * 3 + self.x
 
     @classmethod
     def from_position(cls, position: int, player: str):
+        # The position comes from the game itself, so it doesn't need to be
+        # validated.
         x, y = position % 3, position // 3
-        return cls(x=x, y=y, player=player)
+        return cls.model_construct(x=x, y=y, player=player)
 
 
 class Game(BaseModel):
@@ -60,87 +184,164 @@ class Game(BaseModel):
     board, and determine a winner (if there is one).
     """
 
+    model_config = ConfigDict(extra="ignore")
+
     id: uuid.UUID = Field(default_factory=uuid.uuid4)
     # Not timezone-aware
     created_at: datetime = Field(default_factory=datetime.now)
+    created_seq: int = Field(default_factory=GAME_SEQUENCE.__next__)
     moves: list[Move] = []
-    positions: list[str] = [""] * 9  # defaults to 9 empty strings
-
-    @field_validator("positions")
+    # Bitmasks of the positions occupied by each player
+    x_mask: int = 0
+    o_mask: int = 0
+    # The game state derived from the board is only recalculated when a move is
+    # played, rather than every time it's accessed
+    _winner: str | None = PrivateAttr(default=None)
+    _finished: bool = PrivateAttr(default=False)
+    _next_player: str = PrivateAttr(default="X")
+    # Incremented every time a move is played, to tell when the game changed
+    _version: int = PrivateAttr(default=0)
+
+    @model_validator(mode="before")
     @classmethod
-    def check_length(cls, positions: list[str]) -> list[str]:
+    def positions_to_masks(cls, data):
+        """Build the bitmasks from a positions list of player strings, if given"""
+        if not isinstance(data, dict) or "positions" not in data:
+            return data
+
+        data = dict(data)
+        positions = data.pop("positions")
         if len(positions) != 9:
             raise GameError(
                 f"Cannot play game with {len(positions)} positions, 9 required."
             )
-        return positions
+        if set(positions) - {"X", "O", ""}:
+            raise GameError("Cannot play game with players other than X and O.")
+
+        data["x_mask"] = sum(
+            1 << i for i, player in enumerate(positions) if player == "X"
+        )
+        data["o_mask"] = sum(
+            1 << i for i, player in enumerate(positions) if player == "O"
+        )
+        return data
+
+    @model_validator(mode="after")
+    def check_masks(self) -> "Game":
+        if (self.x_mask | self.o_mask) & ~FULL_BOARD:
+            raise GameError("Cannot play game with positions outside the 9 required.")
+        if self.x_mask & self.o_mask:
+            raise GameError("Cannot play game with positions held by both players.")
+        return self
+
+    def model_post_init(self, _context) -> None:
+        self._update_state()
+
+    def _update_state(self) -> None:
+        if check_win(self.x_mask):
+            self._winner = "X"
+        elif check_win(self.o_mask):
+            self._winner = "O"
+        else:
+            self._winner = None
+
+        self._finished = (
+            self._winner is not None or self.x_mask | self.o_mask == FULL_BOARD
+        )
+        self._next_player = (
+            "X" if self.x_mask.bit_count() == self.o_mask.bit_count() else "O"
+        )
+
+    @computed_field(return_type=list[str])
+    @property
+    def positions(self) -> list[str]:
+        """Player strings indexed to their position on the board"""
+        return [
+            "X" if self.x_mask >> i & 1 else "O" if self.o_mask >> i & 1 else ""
+            for i in range(9)
+        ]
 
     @computed_field(return_type=str)
     @property
     def winner(self) -> str | None:
         """Winning player string if there is a winner"""
-        for line in WINNING_POSITIONS:
-            if (
-                self.positions[line[0]]
-                == self.positions[line[1]]
-                == self.positions[line[2]]
-                != ""
-            ):
-                return self.positions[line[0]]  # Return 'X' or 'O'
-        return None
+        return self._winner
 
     @computed_field(return_type=bool)
     @property
     def finished(self) -> bool:
         """The game is finished (no more moves can be made or there's a winner)"""
-        return self.winner is not None or "" not in self.positions
+        return self._finished
 
     @property
     def next_player(self) -> str:
         """Determine whose turn it is based on board state"""
-        if self.winner or self.finished:
+        if self._finished:
             raise GameOver("No player is next, the game is over")
 
-        x_count = self.positions.count("X")
-        o_count = self.positions.count("O")
+        return self._next_player
 
-        return "X" if x_count == o_count else "O"
+    @property
+    def version(self) -> int:
+        """The number of times the game has changed since it was created"""
+        return self._version
 
     @property
     def empty_positions(self):
-        return [i for i, s in enumerate(self.positions) if s == ""]
+        return list(SET_BITS[~(self.x_mask | self.o_mask) & FULL_BOARD])
 
     def play(self, move: Move):
         """Place the player at the move.position on the board"""
+        position = move.get_position()
+
+        # Every legal move is precomputed, so playing one is a single lookup.
+        # Anything that isn't found is checked to find out why it isn't legal.
+        try:
+            result = TRANSITIONS[self.x_mask, self.o_mask, position, move.player]
+        except KeyError:
+            raise self._move_error(move) from None
+
+        # Play the position
+        self.moves.append(move)
+        self.x_mask, self.o_mask, self._winner, self._finished = result
+        self._next_player = "O" if move.player == "X" else "X"
+        self._version += 1
+
+    def _move_error(self, move: Move) -> GameError:
+        """Determine the error for a move that can't be played"""
 
         # If there are no positions to play, the game is finished, and there's
         # nothing to do here.
         if self.finished:
-            raise GameOver("Unable to play move, game is finished")
+            return GameOver("Unable to play move, game is finished")
 
-        # Get current players and ensure that, if there are two players who
-        # have played the given player is in that set.
-        players = set(self.positions) - {""}
-        if len(players) == 2 and move.player not in players:
-            raise GameError(
-                f"Player {move.player} not in game between {' and '.join(players)}"
-            )
+        # The board only has room for X and O, so make sure the given player is
+        # one of them.
+        if move.player not in ("X", "O"):
+            return GameError(f"Player {move.player} not in game between X and O")
 
         # Make sure it's the player who is trying to move's turn.
         if move.player != self.next_player:
-            raise GameError(f"It is not {move.player}'s turn")
+            return GameError(f"It is not {move.player}'s turn")
 
         position = move.get_position()
+        coordinates = f"x={move.x}, y={move.y}"
+
+        # Make sure the given position index is on the board.
+        if not 0 <= position < 9:
+            return GameError(f"Position {coordinates} is not on the board")
 
         # Make sure the given position index is empty and can be played.
-        if position not in self.empty_positions:
-            raise GameError(
-                f"{move} has already been played by player {self.positions[position]}."
+        if (self.x_mask | self.o_mask) >> position & 1:
+            return GameError(
+                f"Position {coordinates} has already been played by player "
+                f"{self.positions[position]}."
             )
 
-        # Play the position
-        self.moves.append(move)
-        self.positions[position] = move.player
+        # Otherwise the board itself isn't one that can be reached by playing
+        return GameError(
+            f"Player {move.player} cannot play {coordinates} on this board"
+        )
 
 
 def random_move(game: Game, player: str) -> Move:
@@ -149,6 +350,6 @@ def random_move(game: Game, player: str) -> Move:
 
     # game.finished checks that there are empty positions, so we aren't
     # checking that before trying to choose.
-    position = random.choice(game.empty_positions)
+    position = random.choice(SET_BITS[~(game.x_mask | game.o_mask) & FULL_BOARD])
     move = Move.from_position(position=position, player=player)
     return move
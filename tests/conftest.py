@@ -0,0 +1,13 @@
+import pytest
+
+from playox.app import GAME_RESPONSES, GAMES, LOCKS, MOVES_RESPONSES
+
+
+@pytest.fixture(autouse=True)
+def clear_games():
+    """Start every test without any games from previous tests"""
+    GAMES.clear()
+    GAME_RESPONSES.clear()
+    MOVES_RESPONSES.clear()
+    LOCKS.clear()
+    yield
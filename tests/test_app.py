@@ -3,8 +3,16 @@ from unittest import mock
 
 from fastapi.testclient import TestClient
 
-from playox.app import GAMES, app
-from playox.game import Move
+from playox.app import (
+    GAME_RESPONSES,
+    GAMES,
+    LOCKS,
+    MOVES_RESPONSES,
+    LRUDict,
+    app,
+    game_lock,
+)
+from playox.game import Game, Move
 
 client = TestClient(app)
 
@@ -14,7 +22,7 @@ def test_post_game():
     assert response.status_code == 200
 
     game_id = response.json()
-    assert game_id in GAMES
+    assert uuid.UUID(game_id) in GAMES
 
 
 def test_get_game():
@@ -27,6 +35,31 @@ def test_get_game():
     assert data["id"] == game_id
 
 
+def test_get_game_board():
+    game_id = client.post("/api/games").json()
+    client.post(f"/api/games/{game_id}/moves", json={"x": 1, "y": 2})
+
+    data = client.get(f"/api/games/{game_id}").json()
+
+    # The internal positions list is replaced with a 3x3 board
+    assert "positions" not in data
+    assert len(data["board"]) == 3
+    assert all(len(row) == 3 for row in data["board"])
+    assert data["board"][2][1] == "X"
+
+
+def test_get_game_after_move():
+    game_id = client.post("/api/games").json()
+    assert client.get(f"/api/games/{game_id}").json()["moves"] == []
+    assert client.get(f"/api/games/{game_id}/moves").json() == []
+
+    client.post(f"/api/games/{game_id}/moves", json={"x": 0, "y": 0})
+
+    # Cached responses are replaced once the game has changed
+    assert len(client.get(f"/api/games/{game_id}").json()["moves"]) == 2
+    assert len(client.get(f"/api/games/{game_id}/moves").json()) == 2
+
+
 def test_get_game_not_found():
     response = client.get("/api/games/FOOO")
     assert response.status_code == 404
@@ -40,11 +73,8 @@ def test_list_games():
     assert response.status_code == 200
 
     data = response.json()
-    assert len(data) >= 2
-
-    ids = [game["id"] for game in data]
-    assert game_id_1 in ids
-    assert game_id_2 in ids
+    assert [game["id"] for game in data] == [game_id_1, game_id_2]
+    assert all("board" in game for game in data)
 
 
 def test_post_move_valid_move():
@@ -138,3 +168,40 @@ def test_list_moves_ordered(mock_random_move):
 def test_list_moves_game_not_found():
     response = client.get("/api/games/FOOO/moves")
     assert response.status_code == 404
+
+
+def test_lru_dict():
+    games = LRUDict(maxsize=2)
+    games["a"] = 1
+    games["b"] = 2
+
+    # Reading an item makes it the most recently used
+    assert games.get("a") == 1
+
+    games["c"] = 3
+    assert list(games) == ["a", "c"]
+    assert games.get("b") is None
+
+
+@mock.patch.object(GAMES, "maxsize", 1)
+def test_evicted_game_forgotten():
+    game_id = client.post("/api/games").json()
+    client.get(f"/api/games/{game_id}")
+    client.get(f"/api/games/{game_id}/moves")
+    client.post(f"/api/games/{game_id}/moves", json={"x": 0, "y": 0})
+
+    # Adding another game drops the first, along with its responses and lock
+    client.post("/api/games")
+    game_uuid = uuid.UUID(game_id)
+    assert game_uuid not in GAMES
+    assert game_uuid not in GAME_RESPONSES
+    assert game_uuid not in MOVES_RESPONSES
+    assert game_uuid not in LOCKS
+
+
+def test_game_lock():
+    game_1, game_2 = Game(), Game()
+
+    # Each game has its own lock, which is reused for every move in that game
+    assert game_lock(game_1) is game_lock(game_1)
+    assert game_lock(game_1) is not game_lock(game_2)
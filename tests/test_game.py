@@ -1,6 +1,17 @@
+from datetime import datetime
+
 import pytest
 
-from playox.game import Game, GameError, GameOver, Move, random_move
+from playox.game import (
+    TRANSITIONS,
+    WINNING_MASKS,
+    Game,
+    GameError,
+    GameOver,
+    Move,
+    check_win,
+    random_move,
+)
 
 
 def test_game_initialization():
@@ -12,15 +23,88 @@ def test_game_initialization():
     assert game.next_player == "X"
 
 
+def test_game_creation_order():
+    """Test that games are numbered in the order they're created."""
+    first, second = Game(), Game()
+    assert first.created_seq < second.created_seq
+
+
+def test_game_copy_equality():
+    """Test that a copied game is equal to the original."""
+    game = Game()
+    game.play(Move(x=0, y=0, player="X"))
+    assert game == game.model_copy(deep=True)
+
+
 def test_valid_move():
     """Test playing a valid move updates positions correctly."""
     game = Game()
     move = Move(x=0, y=0, player="X")
     game.play(move)
     assert game.positions[0] == "X"
+    assert game.x_mask == 0b000000001
+    assert game.o_mask == 0
     assert game.next_player == "O"
 
 
+def test_positions_from_masks():
+    """Test that positions are derived from the player bitmasks."""
+    game = Game(x_mask=0b100010001, o_mask=0b000001010)
+    assert game.positions == ["X", "O", "", "O", "X", "", "", "", "X"]
+    assert game.winner == "X"
+    assert game.empty_positions == [2, 5, 6, 7]
+
+
+def test_invalid_masks():
+    """Test that masks outside the board or overlapping are rejected."""
+    with pytest.raises(ValueError, match="outside the 9 required"):
+        Game(x_mask=1 << 9)
+    with pytest.raises(ValueError, match="held by both players"):
+        Game(x_mask=0b1, o_mask=0b11)
+
+
+def test_game_from_positions():
+    """Test that a game can be built from a positions list of player strings."""
+    positions = ["X", "O", "", "O", "X", "", "", "", ""]
+    game = Game.model_validate({"positions": positions})
+    assert game.x_mask == 0b000010001
+    assert game.o_mask == 0b000001010
+    assert game.positions == positions
+    assert game.next_player == "X"
+
+
+def test_game_from_invalid_positions():
+    """Test that positions lists of the wrong length or players are rejected."""
+    with pytest.raises(ValueError, match="8 positions, 9 required"):
+        Game.model_validate({"positions": [""] * 8})
+    with pytest.raises(ValueError, match="players other than X and O"):
+        Game.model_validate({"positions": ["Y"] + [""] * 8})
+
+
+def test_move_timestamp():
+    """Test that a move's timestamp is converted from nanoseconds."""
+    move = Move(x=0, y=0, player="X", timestamp_ns=1_700_000_000_123_456_789)
+    assert move.timestamp == datetime.fromtimestamp(1_700_000_000.123456)
+    assert "timestamp_ns" not in move.model_dump()
+
+
+def test_move_timestamp_round_trip():
+    """Test that a move's timestamp survives serializing and loading it."""
+    move = Move(x=0, y=0, player="X")
+    assert Move.model_validate(move.model_dump()) == move
+    assert Move.model_validate_json(move.model_dump_json()) == move
+
+    game = Game()
+    game.play(move)
+    loaded_game = Game.model_validate_json(game.model_dump_json())
+    assert loaded_game.moves[0].timestamp == move.timestamp
+
+    given = Move.model_validate(
+        {"x": 0, "y": 0, "player": "X", "timestamp": datetime(2020, 1, 1, 12, 30)}
+    )
+    assert given.timestamp == datetime(2020, 1, 1, 12, 30)
+
+
 def test_turn_enforcement():
     """Test that playing out of turn raises an error."""
     game = Game()
@@ -45,6 +129,15 @@ def test_move_on_occupied_position():
         game.play(move2)  # noqa: B018
 
 
+def test_move_off_board():
+    """Test that playing a position off the board raises an error."""
+    game = Game()
+    with pytest.raises(GameError, match="is not on the board"):
+        game.play(Move(x=-1, y=0, player="X"))
+    with pytest.raises(GameError, match="is not on the board"):
+        game.play(Move(x=0, y=3, player="X"))
+
+
 def test_winner_row():
     """Test detecting a winner in a row."""
     game = Game()
@@ -85,6 +178,28 @@ def test_winner_diagonal():
         game.next_player  # noqa: B018
 
 
+def test_check_win():
+    """Test the generated win check against every possible player bitmask."""
+    for mask in range(512):
+        expected = any(mask & line == line for line in WINNING_MASKS)
+        assert check_win(mask) == expected
+
+
+def test_transitions_reach_every_board():
+    """Test the transition table covers all 5478 reachable boards."""
+    boards = {(0, 0)} | {
+        (x_mask, o_mask) for x_mask, o_mask, _, _ in TRANSITIONS.values()
+    }
+    assert len(boards) == 5478
+
+
+def test_unreachable_board():
+    """Test that moves on a board that can't be reached by playing are rejected."""
+    game = Game(x_mask=0b000000011)
+    with pytest.raises(GameError, match="cannot play x=2, y=2 on this board"):
+        game.play(Move(x=2, y=2, player="O"))
+
+
 def test_draw_game():
     """Test a full board with no winner is a draw."""
     game = Game()
@@ -125,6 +240,13 @@ def test_game_play_with_bad_player():
         game.play(Move(x=1, y=0, player="Y"))
 
 
+def test_game_play_with_bad_first_player():
+    """Test that a player other than X or O can't start a game."""
+    game = Game()
+    with pytest.raises(GameError, match="not in game between X and O"):
+        game.play(Move(x=0, y=0, player="Y"))
+
+
 def test_random_move():
     game = Game()
     game.play(Move(x=0, y=0, player="X"))